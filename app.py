@@ -16,9 +16,8 @@ backend_path = os.path.join(os.path.dirname(__file__), 'backend')
 sys.path.insert(0, backend_path)
 
 if __name__ == "__main__":
-    import uvicorn
     # backend 디렉토리로 이동하여 import 경로 문제 해결
     os.chdir(backend_path)
-    from main import app
+    from main import run_server
     
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    run_server()
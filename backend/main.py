@@ -6,18 +6,24 @@ Flutter 앱에 API를 제공합니다.
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from datetime import datetime, timedelta
 from typing import List, Optional
 import asyncio
-import json
+import orjson
 import os
+import sys
 
 from websocket_handler import ConnectionManager
 from routes import study_sessions, leaderboard, stats
 from models.database import init_supabase
 
-app = FastAPI(title="Study Tracker API", version="1.0.0")
+app = FastAPI(
+    title="Study Tracker API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse  # orjson으로 응답 직렬화
+)
 
 # CORS 설정 (Flutter 앱에서 접근 가능하도록)
 app.add_middleware(
@@ -28,6 +34,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 세션 목록/리더보드 등 큰 JSON 응답 압축
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # WebSocket 연결 관리자
 manager = ConnectionManager()
 
@@ -40,7 +49,7 @@ app.include_router(stats.router, prefix="/api", tags=["stats"])
 @app.on_event("startup")
 async def startup_event():
     """서버 시작 시 Supabase 초기화"""
-    init_supabase()
+    await init_supabase()
     print("서버가 시작되었습니다.")
 
 
@@ -62,8 +71,16 @@ async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            # 바이너리 프레임(orjson 바이트)을 기본으로 받고, 텍스트 프레임도 호환 처리
+            data = await websocket.receive()
+            if data["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(data.get("code", 1000))
+            payload = data.get("bytes")
+            if payload is None:
+                payload = data.get("text")
+            if payload is None:
+                continue
+            message = orjson.loads(payload)
             await manager.handle_message(websocket, message)
             
             # [추가됨] 메시지 처리 중 연결이 끊겼다면 루프 종료
@@ -71,16 +88,35 @@ async def websocket_endpoint(websocket: WebSocket):
                 break
 
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        await manager.disconnect(websocket)
     except Exception as e:
         print(f"WebSocket 오류: {e}")
         # 이미 연결이 해제된 상태일 수 있으므로 안전하게 처리
         if websocket in manager.active_connections:
-            manager.disconnect(websocket)
+            await manager.disconnect(websocket)
 
 
 
-if __name__ == "__main__":
+def run_server():
+    """uvicorn 서버 실행 (uvloop 이벤트 루프 + httptools HTTP 파서)
+    
+    워커 수는 WORKERS 환경 변수로 지정합니다 (기본값: CPU 코어 수).
+    WebSocket 세션 상태는 연결 단위로 각 워커 프로세스에 유지됩니다.
+    """
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "main:app",  # workers > 1 이면 import 문자열 필요
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WORKERS", os.cpu_count() or 1)),
+        loop="asyncio" if sys.platform == "win32" else "uvloop",  # uvloop은 Windows 미지원
+        http="httptools",
+        limit_concurrency=1000,
+        timeout_keep_alive=30,
+        ws_per_message_deflate=False  # 작은 JSON 제어 메시지는 압축하지 않음
+    )
+
+
+if __name__ == "__main__":
+    run_server()
 
@@ -2,10 +2,13 @@
 Supabase 데이터베이스 연동 모듈
 """
 
-from supabase import create_client, Client
+from supabase import acreate_client, AClient as AsyncClient
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
+import asyncio
 import os
+import sys
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -24,16 +27,31 @@ for _env_path in _possible_paths:
 else:
     load_dotenv()  # 기본 동작
 
-# Supabase 초기화 플래그
-_supabase_initialized = False
-_supabase_client: Optional[Client] = None
+# Supabase 클라이언트 (비동기 클라이언트 하나를 공유하여 HTTP 연결 재사용)
+_async_supabase_client: Optional[AsyncClient] = None
+
+# ISO 타임스탬프 파싱 (Python 3.11부터 fromisoformat이 'Z' 접미사를 직접 처리)
+if sys.version_info >= (3, 11):
+    _parse_timestamp = datetime.fromisoformat
+else:
+    def _parse_timestamp(value: str) -> datetime:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+# 리더보드 캐시 ((period, limit) -> (저장 시각, 정렬된 결과))
+LEADERBOARD_CACHE_TTL = 30.0  # 초 단위
+LEADERBOARD_CACHE_MAX_LIMIT = 100  # 이보다 큰 limit은 캐시하지 않고 바로 조회 (캐시 키 수 제한)
+_leaderboard_cache: Dict[Tuple[str, int], Tuple[float, List[Dict]]] = {}
+# 무효화할 때마다 증가 (조회를 기다리는 동안 무효화되면 이전 결과를 저장하지 않기 위함)
+_leaderboard_generation = 0
+# 키별 잠금 (캐시가 비었을 때 동시 요청이 모두 DB를 조회하지 않도록 한 번만 조회)
+_leaderboard_locks: Dict[Tuple[str, int], asyncio.Lock] = {}
 
 
-def init_supabase():
-    """Supabase 초기화"""
-    global _supabase_initialized, _supabase_client
+async def init_supabase():
+    """Supabase 초기화 (서버 startup 이벤트에서 한 번 호출)"""
+    global _async_supabase_client
     
-    if _supabase_initialized:
+    if _async_supabase_client is not None:
         return
     
     # Supabase 인증 정보 (환경 변수에서 읽기)
@@ -46,19 +64,19 @@ def init_supabase():
             "Supabase 프로젝트 설정에서 URL과 anon key를 확인할 수 있습니다."
         )
     
-    _supabase_client = create_client(supabase_url, supabase_key)
-    _supabase_initialized = True
+    _async_supabase_client = await acreate_client(supabase_url, supabase_key)
     print("Supabase가 초기화되었습니다.")
 
 
-def get_db() -> Client:
-    """Supabase 클라이언트 인스턴스 반환"""
-    if not _supabase_initialized:
-        init_supabase()
-    return _supabase_client
+def get_db() -> AsyncClient:
+    """Supabase 클라이언트 인스턴스 반환
+    
+    startup 이벤트에서 init_supabase()가 먼저 실행되므로 초기화 여부는 확인하지 않습니다.
+    """
+    return _async_supabase_client
 
 
-def save_study_session(session_data: Dict) -> str:
+async def save_study_session(session_data: Dict) -> str:
     """공부 세션 데이터를 Supabase에 저장"""
     db = get_db()
     
@@ -73,16 +91,26 @@ def save_study_session(session_data: Dict) -> str:
         "created_at": datetime.now().isoformat()
     }
     
-    response = db.table("study_sessions").insert(session_record).execute()
+    response = await db.table("study_sessions").insert(session_record).execute()
+    
+    # 새 세션이 저장되면 리더보드 캐시 무효화
+    invalidate_leaderboard_cache()
     
     if response.data and len(response.data) > 0:
         return response.data[0]["id"]
     raise Exception("세션 저장 실패")
 
 
-def get_user_sessions(user_id: str, start_date: Optional[datetime] = None, 
-                     end_date: Optional[datetime] = None) -> List[Dict]:
-    """사용자의 공부 세션 목록 조회"""
+async def get_user_sessions(user_id: str, start_date: Optional[datetime] = None, 
+                           end_date: Optional[datetime] = None, parse: bool = True,
+                           limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+    """사용자의 공부 세션 목록 조회
+    
+    Args:
+        parse: False이면 시간 필드를 ISO 문자열 그대로 반환 (JSON으로 바로 응답하는 경우)
+        limit: 반환할 최대 세션 수 (None이면 전체)
+        offset: 건너뛸 세션 수 (limit과 함께 사용)
+    """
     db = get_db()
     
     query = db.table("study_sessions").select("*").eq("user_id", user_id)
@@ -94,26 +122,33 @@ def get_user_sessions(user_id: str, start_date: Optional[datetime] = None,
     
     query = query.order("start_time", desc=True)
     
-    response = query.execute()
+    # 페이지 범위는 DB에서 잘라서 필요한 행만 전송
+    if limit is not None:
+        query = query.range(offset, offset + limit - 1)
+    
+    response = await query.execute()
+    
+    if not parse:
+        return response.data
     
     sessions = []
     for session in response.data:
         # ISO 형식 문자열을 datetime 객체로 변환
-        session["start_time"] = datetime.fromisoformat(session["start_time"].replace("Z", "+00:00"))
-        session["end_time"] = datetime.fromisoformat(session["end_time"].replace("Z", "+00:00"))
+        session["start_time"] = _parse_timestamp(session["start_time"])
+        session["end_time"] = _parse_timestamp(session["end_time"])
         if session.get("created_at"):
-            session["created_at"] = datetime.fromisoformat(session["created_at"].replace("Z", "+00:00"))
+            session["created_at"] = _parse_timestamp(session["created_at"])
         sessions.append(session)
     
     return sessions
 
 
-def get_user_daily_stats(user_id: str, date: datetime) -> Dict:
+async def get_user_daily_stats(user_id: str, date: datetime) -> Dict:
     """사용자의 특정 날짜 통계 조회"""
     start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
     end_of_day = date.replace(hour=23, minute=59, second=59, microsecond=999999)
     
-    sessions = get_user_sessions(user_id, start_of_day, end_of_day)
+    sessions = await get_user_sessions(user_id, start_of_day, end_of_day, parse=False)
     
     total_time = sum(s["total_time"] for s in sessions)
     focused_time = sum(s["focused_time"] for s in sessions)
@@ -128,40 +163,83 @@ def get_user_daily_stats(user_id: str, date: datetime) -> Dict:
     }
 
 
-def get_user_weekly_stats(user_id: str, week_start: datetime) -> List[Dict]:
+async def get_user_summary_stats(user_id: str, today: datetime, week_start: datetime,
+                                 month_start: datetime) -> Dict:
+    """사용자 전체/오늘/이번 주/이번 달 합계를 한 번의 쿼리로 조회"""
+    db = get_db()
+    
+    response = await db.rpc("user_summary", {
+        "p_user_id": user_id,
+        "p_today": today.isoformat(),
+        "p_week_start": week_start.isoformat(),
+        "p_month_start": month_start.isoformat()
+    }).execute()
+    
+    return response.data[0]
+
+
+async def get_user_weekly_stats(user_id: str, week_start: datetime) -> List[Dict]:
     """사용자의 주간 통계 조회"""
-    week_end = week_start + timedelta(days=7)
-    sessions = get_user_sessions(user_id, week_start, week_end)
-    
-    # 날짜별로 그룹화
-    daily_stats = {}
-    for session in sessions:
-        session_date = session["start_time"].date()
-        if session_date not in daily_stats:
-            daily_stats[session_date] = {
-                "date": session_date.isoformat(),
-                "total_time": 0,
-                "focused_time": 0,
-                "unfocused_time": 0,
-                "session_count": 0
-            }
-        
-        daily_stats[session_date]["total_time"] += session["total_time"]
-        daily_stats[session_date]["focused_time"] += session["focused_time"]
-        daily_stats[session_date]["unfocused_time"] += session["unfocused_time"]
-        daily_stats[session_date]["session_count"] += 1
+    db = get_db()
+    
+    # 날짜별 그룹화/정렬은 DB 함수(user_weekly_stats)에서 수행
+    response = await db.rpc("user_weekly_stats", {
+        "p_user_id": user_id,
+        "p_week_start": week_start.isoformat()
+    }).execute()
     
-    # 날짜 순으로 정렬
-    return sorted(daily_stats.values(), key=lambda x: x["date"])
+    return response.data
 
 
-def get_leaderboard(period: str = "day", limit: int = 100) -> List[Dict]:
-    """리더보드 데이터 조회
+def invalidate_leaderboard_cache():
+    """리더보드 캐시 초기화"""
+    global _leaderboard_generation
+    _leaderboard_generation += 1
+    _leaderboard_cache.clear()
+
+
+def _get_cached_leaderboard(key: Tuple[str, int]) -> Optional[List[Dict]]:
+    """TTL 내의 캐시된 리더보드 복사본 반환 (없으면 None)"""
+    cached = _leaderboard_cache.get(key)
+    if cached and time.monotonic() - cached[0] < LEADERBOARD_CACHE_TTL:
+        # 호출 측에서 순위 등을 추가하므로 복사본 반환
+        return [dict(entry) for entry in cached[1]]
+    return None
+
+
+async def get_leaderboard(period: str = "day", limit: int = 100) -> List[Dict]:
+    """리더보드 데이터 조회 (limit이 LEADERBOARD_CACHE_MAX_LIMIT 이하면 TTL 캐시 적용)
     
     Args:
         period: 'day', 'week', 'month' 중 하나
         limit: 반환할 최대 사용자 수
     """
+    if limit > LEADERBOARD_CACHE_MAX_LIMIT:
+        return await _query_leaderboard(period, limit)
+    
+    key = (period, limit)
+    cached = _get_cached_leaderboard(key)
+    if cached is not None:
+        return cached
+    
+    lock = _leaderboard_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        # 잠금을 기다리는 동안 다른 요청이 캐시를 채웠을 수 있으므로 다시 확인
+        cached = _get_cached_leaderboard(key)
+        if cached is not None:
+            return cached
+        
+        generation = _leaderboard_generation
+        leaderboard = await _query_leaderboard(period, limit)
+        # 조회 중 세션이 저장되어 무효화되었다면 이전 결과는 캐시하지 않음
+        if generation == _leaderboard_generation:
+            _leaderboard_cache[key] = (time.monotonic(), leaderboard)
+    
+    return [dict(entry) for entry in leaderboard]
+
+
+async def _query_leaderboard(period: str, limit: int) -> List[Dict]:
+    """Supabase에서 리더보드 집계"""
     db = get_db()
     
     # 기간에 따른 시작 날짜 계산
@@ -175,39 +253,24 @@ def get_leaderboard(period: str = "day", limit: int = 100) -> List[Dict]:
     else:
         start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
     
-    # 해당 기간의 모든 세션 조회
-    response = db.table("study_sessions")\
-        .select("*")\
-        .gte("start_time", start_date.isoformat())\
-        .execute()
+    # 사용자별 집계/정렬은 DB 함수(leaderboard_for_period)에서 수행
+    response = await db.rpc("leaderboard_for_period", {
+        "p_start": start_date.isoformat(),
+        "p_limit": limit
+    }).execute()
     
-    # 사용자별로 집계
-    user_stats = {}
-    for session in response.data:
-        user_id = session["user_id"]
-        
-        if user_id not in user_stats:
-            user_stats[user_id] = {
-                "user_id": user_id,
-                "total_time": 0,
-                "focused_time": 0,
-                "session_count": 0
-            }
-        
-        user_stats[user_id]["total_time"] += session["total_time"]
-        user_stats[user_id]["focused_time"] += session["focused_time"]
-        user_stats[user_id]["session_count"] += 1
-    
-    # 총 시간 기준으로 정렬
-    leaderboard = sorted(user_stats.values(), key=lambda x: x["total_time"], reverse=True)
-    return leaderboard[:limit]
+    return response.data
 
 
-def get_current_session(user_id: str) -> Optional[Dict]:
-    """현재 진행 중인 세션 조회"""
+async def get_current_session(user_id: str) -> Optional[Dict]:
+    """사용자의 가장 최근 세션 조회
+    
+    세션은 종료 시점에만 저장되므로(end_time NOT NULL) 진행 중인 세션 대신
+    마지막으로 저장된 세션을 반환합니다.
+    """
     db = get_db()
     
-    response = db.table("study_sessions")\
+    response = await db.table("study_sessions")\
         .select("*")\
         .eq("user_id", user_id)\
         .order("start_time", desc=True)\
@@ -217,12 +280,12 @@ def get_current_session(user_id: str) -> Optional[Dict]:
     if response.data and len(response.data) > 0:
         session = response.data[0]
         # ISO 형식 문자열을 datetime 객체로 변환
-        session["start_time"] = datetime.fromisoformat(session["start_time"].replace("Z", "+00:00"))
+        session["start_time"] = _parse_timestamp(session["start_time"])
         if session.get("end_time"):
-            session["end_time"] = datetime.fromisoformat(session["end_time"].replace("Z", "+00:00"))
+            session["end_time"] = _parse_timestamp(session["end_time"])
         if session.get("created_at"):
-            session["created_at"] = datetime.fromisoformat(session["created_at"].replace("Z", "+00:00"))
-        # 세션이 아직 종료되지 않았는지 확인
+            session["created_at"] = _parse_timestamp(session["created_at"])
+        # 저장된(종료 시간이 있는) 세션만 반환
         if "end_time" in session and session["end_time"]:
             return session
     return None
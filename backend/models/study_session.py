@@ -2,7 +2,7 @@
 공부 세션 데이터 모델
 """
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 from typing import Optional
 
@@ -17,11 +17,6 @@ class StudySession(BaseModel):
     focused_time: float  # 초 단위
     unfocused_time: float  # 초 단위
     created_at: Optional[datetime] = None
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class StudySessionCreate(BaseModel):
@@ -36,6 +31,8 @@ class StudySessionCreate(BaseModel):
 
 class StudySessionResponse(BaseModel):
     """세션 응답 모델"""
+    model_config = ConfigDict(from_attributes=True)
+    
     id: str
     user_id: str
     start_time: str
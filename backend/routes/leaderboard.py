@@ -2,7 +2,7 @@
 경쟁 리그 관련 API 라우트
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from typing import List
 from models.database import get_leaderboard
 
@@ -10,7 +10,7 @@ router = APIRouter()
 
 
 @router.get("/leaderboard/{period}")
-async def get_leaderboard_data(period: str, limit: int = 100):
+async def get_leaderboard_data(period: str, limit: int = Query(100, ge=1)):
     """리더보드 데이터 조회
     
     Args:
@@ -24,7 +24,7 @@ async def get_leaderboard_data(period: str, limit: int = 100):
         )
     
     try:
-        leaderboard = get_leaderboard(period, limit)
+        leaderboard = await get_leaderboard(period, limit)
         
         # 순위 추가
         for i, entry in enumerate(leaderboard, 1):
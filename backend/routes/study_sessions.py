@@ -2,7 +2,8 @@
 공부 세션 관련 API 라우트
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from pydantic import TypeAdapter
 from typing import List, Optional
 from datetime import datetime, timedelta
 from models.study_session import StudySessionResponse
@@ -15,52 +16,49 @@ from models.database import (
 
 router = APIRouter()
 
+# 세션 목록 검증/직렬화용 (pydantic-core에서 일괄 처리)
+_session_list_adapter = TypeAdapter(List[StudySessionResponse])
+
 
 @router.get("/sessions/{user_id}", response_model=List[StudySessionResponse])
 async def get_sessions(
     user_id: str,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    limit: int = 100
+    limit: int = Query(100, ge=1),
+    offset: int = Query(0, ge=0)
 ):
     """사용자의 공부 세션 목록 조회"""
     try:
         start = datetime.fromisoformat(start_date) if start_date else None
         end = datetime.fromisoformat(end_date) if end_date else None
         
-        sessions = get_user_sessions(user_id, start, end)
-        
-        # 응답 형식 변환
-        response = []
-        for session in sessions[:limit]:
-            response.append({
-                "id": session["id"],
-                "user_id": session["user_id"],
-                "start_time": session["start_time"].isoformat() if isinstance(session["start_time"], datetime) else session["start_time"],
-                "end_time": session["end_time"].isoformat() if isinstance(session["end_time"], datetime) else session["end_time"],
-                "total_time": session["total_time"],
-                "focused_time": session["focused_time"],
-                "unfocused_time": session["unfocused_time"],
-                "created_at": session.get("created_at", datetime.now()).isoformat() if isinstance(session.get("created_at"), datetime) else session.get("created_at", "")
-            })
+        # 시간 필드는 ISO 문자열 그대로 응답에 사용
+        sessions = await get_user_sessions(user_id, start, end, parse=False,
+                                           limit=limit, offset=offset)
         
-        return response
+        # 응답 모델 검증 + JSON 직렬화를 한 번에 처리하여 바로 응답
+        validated = _session_list_adapter.validate_python(sessions)
+        return Response(
+            content=_session_list_adapter.dump_json(validated),
+            media_type="application/json"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/sessions/{user_id}/current")
 async def get_current_user_session(user_id: str):
-    """현재 진행 중인 세션 조회"""
+    """가장 최근에 저장된 세션 조회"""
     try:
-        session = get_current_session(user_id)
+        session = await get_current_session(user_id)
         if not session:
             return None
         
         return {
             "id": session["id"],
             "user_id": session["user_id"],
-            "start_time": session["start_time"].isoformat() if isinstance(session["start_time"], datetime) else session["start_time"],
+            "start_time": session["start_time"],
             "end_time": session.get("end_time", ""),
             "total_time": session.get("total_time", 0),
             "focused_time": session.get("focused_time", 0),
@@ -75,7 +73,7 @@ async def get_daily_stats(user_id: str, date: str):
     """특정 날짜의 통계 조회"""
     try:
         target_date = datetime.fromisoformat(date)
-        stats = get_user_daily_stats(user_id, target_date)
+        stats = await get_user_daily_stats(user_id, target_date)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -97,7 +95,7 @@ async def get_weekly_stats(
             start = today - timedelta(days=days_since_monday)
             start = start.replace(hour=0, minute=0, second=0, microsecond=0)
         
-        stats = get_user_weekly_stats(user_id, start)
+        stats = await get_user_weekly_stats(user_id, start)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -3,84 +3,148 @@ WebSocket 연결 관리 및 메시지 처리
 """
 
 from fastapi import WebSocket
-from typing import List, Dict, Optional
-import json
+from typing import Dict, Optional, Set, Tuple
+import asyncio
 import time
+import orjson
 from datetime import datetime
 from models.database import save_study_session, get_current_session
 from models.study_session import StudySession
 
+# pong / session_started 응답은 형태가 고정되어 있으므로 미리 직렬화해 두고 timestamp만 붙여서 전송
+_PONG_PREFIX = b'{"type":"pong","timestamp":'
+_SESSION_STARTED_PREFIX = orjson.dumps({
+    "type": "session_started",
+    "message": "세션이 시작되었습니다."
+})[:-1] + b',"timestamp":'
+
+
+class SessionState:
+    """연결별 세션 상태 (__slots__로 인스턴스 dict 없이 저장)"""
+    
+    __slots__ = ("user_id", "session_start_datetime", "focused_time", "unfocused_time",
+                 "last_status", "out_q", "writer_task")
+    
+    def __init__(self, out_q: asyncio.Queue, writer_task: asyncio.Task):
+        self.user_id: Optional[str] = None
+        self.session_start_datetime: Optional[datetime] = None
+        self.focused_time = 0.0
+        self.unfocused_time = 0.0
+        self.last_status = True
+        self.out_q = out_q
+        self.writer_task = writer_task
+
 
 class ConnectionManager:
     """WebSocket 연결 관리자"""
     
+    # 클라이언트별 전송 큐 최대 길이 (가득 차면 느린 클라이언트로 보고 연결 해제)
+    SEND_QUEUE_SIZE = 100
+    
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.client_sessions: Dict[WebSocket, Dict] = {}
+        self.active_connections: Set[WebSocket] = set()
+        self.client_sessions: Dict[WebSocket, SessionState] = {}
     
     async def connect(self, websocket: WebSocket):
         """클라이언트 연결"""
         await websocket.accept()
-        self.active_connections.append(websocket)
-        self.client_sessions[websocket] = {
-            "user_id": None,
-            "session_start_datetime": None,
-            "focused_time": 0.0,
-            "unfocused_time": 0.0,
-            "last_status": True
-        }
+        self.active_connections.add(websocket)
+        
+        # 클라이언트마다 전송 큐와 전송 태스크를 두어 느린 클라이언트가 다른 전송을 막지 않도록 함
+        out_q: asyncio.Queue = asyncio.Queue(maxsize=self.SEND_QUEUE_SIZE)
+        self.client_sessions[websocket] = SessionState(
+            out_q, asyncio.create_task(self._writer(websocket, out_q))
+        )
         print(f"클라이언트 연결됨. 총 연결 수: {len(self.active_connections)}")
     
-    def disconnect(self, websocket: WebSocket):
+    async def disconnect(self, websocket: WebSocket):
         """클라이언트 연결 해제"""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        self.active_connections.discard(websocket)
+        
+        # 저장(await) 중 중복 해제 호출이 와도 한 번만 처리되도록 먼저 제거
+        session_info = self.client_sessions.pop(websocket, None)
+        if session_info is None:
+            return
+        
+        # 전송 태스크 종료 (전송 태스크 자신이 해제를 호출한 경우는 제외)
+        writer_task = session_info.writer_task
+        if writer_task is not asyncio.current_task():
+            writer_task.cancel()
         
-        if websocket in self.client_sessions:
-            session_info = self.client_sessions[websocket]
-            if session_info["session_start_datetime"]:
-                self._finalize_session(websocket, session_info)
-            del self.client_sessions[websocket]
+        if session_info.session_start_datetime:
+            await self._finalize_session(websocket, session_info)
         
         print(f"클라이언트 연결 해제됨. 총 연결 수: {len(self.active_connections)}")
     
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        """특정 클라이언트에게 메시지 전송"""
-        try:
-            await websocket.send_text(message)
-        except Exception as e:
-            print(f"메시지 전송 실패: {e}")
-            self.disconnect(websocket)
-    
-    async def broadcast(self, message: str):
-        """모든 클라이언트에게 브로드캐스트"""
-        disconnected = []
-        for connection in self.active_connections:
+    async def _writer(self, websocket: WebSocket, out_q: asyncio.Queue):
+        """전송 큐의 메시지를 순서대로 클라이언트에게 전송"""
+        while True:
+            message = await out_q.get()
             try:
-                await connection.send_text(message)
+                await websocket.send_bytes(message)
             except Exception as e:
-                print(f"브로드캐스트 실패: {e}")
-                disconnected.append(connection)
+                print(f"메시지 전송 실패: {e}")
+                await self.disconnect(websocket)
+                return
+    
+    def _enqueue(self, websocket: WebSocket, message: bytes) -> bool:
+        """클라이언트 전송 큐에 메시지 추가 (큐가 가득 차면 False)"""
+        session_info = self.client_sessions.get(websocket)
+        if not session_info:
+            return True
+        try:
+            session_info.out_q.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+    
+    async def send_personal_message(self, message: bytes, websocket: WebSocket):
+        """특정 클라이언트에게 메시지 전송 (직렬화된 JSON 바이트)"""
+        if not self._enqueue(websocket, message):
+            print("메시지 전송 실패: 전송 큐가 가득 찼습니다.")
+            await self.disconnect(websocket)
+    
+    async def broadcast(self, message: Dict):
+        """모든 클라이언트에게 브로드캐스트 (각 클라이언트 전송 큐에 추가)"""
+        # 메시지는 한 번만 직렬화하여 모든 연결에 재사용
+        payload = orjson.dumps(message)
+        stalled = [
+            connection for connection in list(self.active_connections)
+            if not self._enqueue(connection, payload)
+        ]
         
-        for conn in disconnected:
-            self.disconnect(conn)
+        for connection in stalled:
+            print("브로드캐스트 실패: 전송 큐가 가득 찼습니다.")
+            await self.disconnect(connection)
     
-    def _finalize_session(self, websocket: WebSocket, session_info: Dict):
-        """세션 종료 및 데이터 저장"""
-        # 세션이 시작되지 않았거나 이미 저장된 경우 리턴 (중복 저장 방지)
-        if not session_info.get("session_start_datetime"):
-            return
+    async def _finalize_session(self, websocket: WebSocket, session_info: SessionState,
+                                duration: float = 0.0) -> Tuple[float, float, float]:
+        """세션 종료 및 데이터 저장
         
-        end_datetime = datetime.now()
-        start_datetime = session_info["session_start_datetime"]
+        Args:
+            duration: 마지막 상태의 지속 시간 (클라이언트가 보낸 값)
+        
+        Returns:
+            (집중 시간, 비집중 시간, 총 시간) - 0.01초 단위로 반올림된 값
+        """
+        if duration > 0:
+            self._accumulate_duration(session_info, duration, " (마지막)")
         
         # 0.01초 분해능으로 반올림
-        focused_time = round(session_info["focused_time"], 2)
-        unfocused_time = round(session_info["unfocused_time"], 2)
+        focused_time = round(session_info.focused_time, 2)
+        unfocused_time = round(session_info.unfocused_time, 2)
         total_time = round(focused_time + unfocused_time, 2)
+        totals = (focused_time, unfocused_time, total_time)
+        
+        # 세션이 시작되지 않았거나 이미 저장된 경우 리턴 (중복 저장 방지)
+        if not session_info.session_start_datetime:
+            return totals
+        
+        end_datetime = datetime.now()
+        start_datetime = session_info.session_start_datetime
         
         session_data = {
-            "user_id": session_info["user_id"],
+            "user_id": session_info.user_id,
             "start_time": start_datetime,
             "end_time": end_datetime,
             "total_time": total_time,
@@ -88,20 +152,33 @@ class ConnectionManager:
             "unfocused_time": unfocused_time
         }
         
+        # [수정됨] 저장 전에 시작 시간을 None으로 설정하여 중복 처리 방지
+        # (저장을 기다리는 동안 다른 경로에서 다시 호출될 수 있음)
+        session_info.session_start_datetime = None
+        
         try:
-            save_study_session(session_data)
+            await save_study_session(session_data)
             print(f"\n세션 데이터 저장 완료:")
-            print(f"  사용자: {session_info['user_id']}")
+            print(f"  사용자: {session_info.user_id}")
             print(f"  총 시간: {total_time:.2f}초")
             if total_time > 0:
                 print(f"  집중 시간: {focused_time:.2f}초 ({focused_time/total_time*100:.1f}%)")
                 print(f"  비집중 시간: {unfocused_time:.2f}초 ({unfocused_time/total_time*100:.1f}%)")
-            
-            # [수정됨] 저장 후 시작 시간을 None으로 설정하여 중복 처리 방지
-            session_info["session_start_datetime"] = None
-            
         except Exception as e:
             print(f"세션 데이터 저장 실패: {e}")
+            # 저장에 실패하면 시작 시간을 되돌려 연결 해제 시 다시 저장을 시도
+            session_info.session_start_datetime = start_datetime
+        
+        return totals
+    
+    def _accumulate_duration(self, session_info: SessionState, duration: float, label: str = ""):
+        """이전 상태(last_status)의 지속 시간을 집중/비집중 시간에 누적"""
+        if session_info.last_status:
+            session_info.focused_time += duration
+            print(f"✓ 집중{label} +{duration:.2f}초 (총 집중: {session_info.focused_time:.2f}초)")
+        else:
+            session_info.unfocused_time += duration
+            print(f"✗ 비집중{label} +{duration:.2f}초 (총 비집중: {session_info.unfocused_time:.2f}초)")
     
     async def handle_message(self, websocket: WebSocket, message: Dict):
         """받은 메시지 처리"""
@@ -111,56 +188,36 @@ class ConnectionManager:
         if not session_info:
             return
         
+        now = time.time()
+        
         if msg_type == "session_start":
             # 세션 시작
-            session_info["user_id"] = message.get("user_id")
-            session_info["session_start_datetime"] = datetime.now()
-            session_info["focused_time"] = 0.0
-            session_info["unfocused_time"] = 0.0
-            session_info["last_status"] = True
+            session_info.user_id = message.get("user_id")
+            session_info.session_start_datetime = datetime.now()
+            session_info.focused_time = 0.0
+            session_info.unfocused_time = 0.0
+            session_info.last_status = True
             
-            response = {
-                "type": "session_started",
-                "message": "세션이 시작되었습니다.",
-                "timestamp": time.time()
-            }
-            await self.send_personal_message(json.dumps(response), websocket)
-            print(f"세션 시작: 사용자 {session_info['user_id']}")
+            response = _SESSION_STARTED_PREFIX + str(now).encode() + b"}"
+            await self.send_personal_message(response, websocket)
+            print(f"세션 시작: 사용자 {session_info.user_id}")
         
         elif msg_type == "status_update":
             # 집중 상태 업데이트
-            is_focused = message.get("is_focused", True)
             duration = message.get("duration", 0.0)  # 클라이언트가 보낸 지속 시간
             
+            # 하트비트(지속 시간 0)는 누적할 시간이 없으므로 상태만 갱신
             if duration > 0:
-                # 클라이언트가 계산한 지속 시간 사용
-                if session_info["last_status"]:
-                    session_info["focused_time"] += duration
-                    print(f"✓ 집중 +{duration:.2f}초 (총 집중: {session_info['focused_time']:.2f}초)")
-                else:
-                    session_info["unfocused_time"] += duration
-                    print(f"✗ 비집중 +{duration:.2f}초 (총 비집중: {session_info['unfocused_time']:.2f}초)")
+                self._accumulate_duration(session_info, duration)
             
             # 현재 상태로 업데이트
-            session_info["last_status"] = is_focused
+            session_info.last_status = message.get("is_focused", True)
         
         elif msg_type == "session_end":
-            # 세션 종료
-            duration = message.get("duration", 0.0)
-            if duration > 0:
-                if session_info["last_status"]:
-                    session_info["focused_time"] += duration
-                    print(f"✓ 집중 (마지막) +{duration:.2f}초 (총 집중: {session_info['focused_time']:.2f}초)")
-                else:
-                    session_info["unfocused_time"] += duration
-                    print(f"✗ 비집중 (마지막) +{duration:.2f}초 (총 비집중: {session_info['unfocused_time']:.2f}초)")
-            
-            self._finalize_session(websocket, session_info)
-            
-            # 0.01초 분해능으로 반올림
-            focused_time = round(session_info["focused_time"], 2)
-            unfocused_time = round(session_info["unfocused_time"], 2)
-            total_time = round(focused_time + unfocused_time, 2)
+            # 세션 종료 (마지막 상태의 지속 시간까지 합산하여 저장)
+            focused_time, unfocused_time, total_time = await self._finalize_session(
+                websocket, session_info, message.get("duration", 0.0)
+            )
             
             response = {
                 "type": "session_ended",
@@ -170,14 +227,11 @@ class ConnectionManager:
                     "focused_time": focused_time,
                     "unfocused_time": unfocused_time
                 },
-                "timestamp": time.time()
+                "timestamp": now
             }
-            await self.send_personal_message(json.dumps(response), websocket)
-            print(f"✓ 세션 종료 응답 전송: 사용자 {session_info['user_id']}")
+            await self.send_personal_message(orjson.dumps(response), websocket)
+            print(f"✓ 세션 종료 응답 전송: 사용자 {session_info.user_id}")
         
         elif msg_type == "ping":
-            response = {
-                "type": "pong",
-                "timestamp": time.time()
-            }
-            await self.send_personal_message(json.dumps(response), websocket)
\ No newline at end of file
+            pong = _PONG_PREFIX + str(now).encode() + b"}"
+            await self.send_personal_message(pong, websocket)
\ No newline at end of file
@@ -5,27 +5,64 @@
 
 import cv2
 import mediapipe as mp
+import numpy as np
+import orjson
 import websockets
 import asyncio
-import json
+import atexit
+import concurrent.futures
+import logging
+import math
+import signal
 import time
+from collections import deque
 from typing import Optional
 
+try:
+    import uvloop  # libuv 기반 이벤트 루프 (Windows 미지원)
+except ImportError:
+    uvloop = None
+
 # MediaPipe 얼굴 메시 설정
 mp_face_mesh = mp.solutions.face_mesh
 mp_drawing = mp.solutions.drawing_utils
 
+logger = logging.getLogger(__name__)
 
-class FocusDetector:
-    """집중도 감지 클래스"""
-    
-    def __init__(self):
-        self.face_mesh = mp_face_mesh.FaceMesh(
+# FaceMesh는 TFLite 텐서 메모리(수십 MB)를 잡으므로 프로세스에서 하나만 생성하여 공유
+_FACE_MESH = None
+
+
+def get_face_mesh():
+    """공유 FaceMesh 인스턴스 반환 (처음 호출 시 생성)"""
+    global _FACE_MESH
+    if _FACE_MESH is None:
+        _FACE_MESH = mp_face_mesh.FaceMesh(
             max_num_faces=1,
             refine_landmarks=True,
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5
         )
+    return _FACE_MESH
+
+
+def close_face_mesh():
+    """공유 FaceMesh 인스턴스 해제 (프로세스 종료 시 atexit으로 호출)"""
+    global _FACE_MESH
+    if _FACE_MESH is not None:
+        _FACE_MESH.close()
+        _FACE_MESH = None
+
+
+atexit.register(close_face_mesh)
+
+
+class FocusDetector:
+    """집중도 감지 클래스"""
+    
+    def __init__(self, debug: bool = False):
+        self.debug = debug  # True이면 프레임별 EAR/얼굴 방향 로그 출력
+        self.face_mesh = get_face_mesh()
         
         # 간단한 눈 랜드마크 인덱스 (상하좌우 6개 점만 사용)
         # 왼쪽 눈
@@ -50,9 +87,13 @@ class FocusDetector:
         
         # 집중도 판단 기준
         self.ear_threshold = 0.21  # 눈 감김 기준
-        self.ear_history = []
+        self.head_offset_threshold = 0.08  # 정면 판단 기준
         self.history_size = 5
         
+        # EAR 히스토리 (누적 합을 함께 갱신하여 평균 계산)
+        self.ear_history = deque(maxlen=self.history_size)
+        self._ear_sum = 0.0
+        
         # 얼굴 방향 판단용
         self.nose_index = 1
         self.left_eye_center = 33
@@ -75,7 +116,7 @@ class FocusDetector:
     
     def _distance(self, point1, point2):
         """두 점 사이의 거리 계산"""
-        return ((point1.x - point2.x)**2 + (point1.y - point2.y)**2)**0.5
+        return math.hypot(point1.x - point2.x, point1.y - point2.y)
     
     def calculate_head_pose(self, landmarks):
         """얼굴 방향 계산"""
@@ -95,26 +136,28 @@ class FocusDetector:
         right_ear = self.calculate_ear(landmarks, self.RIGHT_EYE)
         avg_ear = (left_ear + right_ear) / 2.0
         
-        # 2. EAR 히스토리에 추가
+        # 2. EAR 히스토리에 추가 (가득 차 있으면 밀려나는 값을 누적 합에서 제외)
+        if len(self.ear_history) == self.history_size:
+            self._ear_sum -= self.ear_history[0]
         self.ear_history.append(avg_ear)
-        if len(self.ear_history) > self.history_size:
-            self.ear_history.pop(0)
+        self._ear_sum += avg_ear
         
         if len(self.ear_history) < self.history_size:
             return True
         
         # 3. 평균 EAR 계산
-        avg_ear_value = sum(self.ear_history) / len(self.ear_history)
+        avg_ear_value = self._ear_sum / self.history_size
         
         # 4. 얼굴 방향 계산
         head_offset = self.calculate_head_pose(landmarks)
         
         # 5. 판단 기준
         eyes_open = avg_ear_value > self.ear_threshold  # 눈이 떠져 있음
-        looking_forward = head_offset < 0.08  # 정면을 보고 있음
+        looking_forward = head_offset < self.head_offset_threshold  # 정면을 보고 있음
         
-        # 디버그 출력 (너무 빈번하면 주석 처리 가능)
-        # print(f"EAR: {avg_ear_value:.3f}, Head: {head_offset:.3f}")
+        # 디버그 출력 (매 프레임 호출되므로 --debug일 때만)
+        if self.debug:
+            logger.debug("EAR: %.3f, Head: %.3f", avg_ear_value, head_offset)
         
         is_focused = eyes_open and looking_forward
         
@@ -122,17 +165,46 @@ class FocusDetector:
 
 
 class CameraClient:
-    def __init__(self, server_url: str = "ws://localhost:8000/ws", user_id: str = "user1"):
+    def __init__(self, server_url: str = "ws://localhost:8000/ws", user_id: str = "user1",
+                 debug: bool = False, headless: bool = False):
         self.server_url = server_url
         self.user_id = user_id
+        self.debug = debug
+        self.headless = headless  # True이면 미리보기 창 없이 감지/전송만 수행
         self.websocket: Optional[websockets.WebSocketClientProtocol] = None
-        self.detector = FocusDetector()
+        self.detector = FocusDetector(debug=debug)
+        
+        # 캡처 해상도 / 추론 입력 최대 너비 (FaceMesh 비용은 픽셀 수에 비례)
+        self.capture_size = (640, 480)
+        self.inference_width = 640
+        self._rgb: Optional[np.ndarray] = None  # 재사용하는 RGB 변환 버퍼
+        
+        # FaceMesh 추론 / 프레임 캡처 전용 스레드 (run()마다 새로 만들고 종료 시 정리)
+        self._inference_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._capture_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        # 파이프라인 단계 사이 큐 길이 (느린 단계가 앞 단계를 멈추게 하여 지연 누적 방지)
+        self.pipeline_queue_size = 2
+        
+        # 움직임 게이트: 직전 추론 프레임과 거의 같으면 FaceMesh를 건너뛰고 결과 재사용
+        self.motion_threshold = 32 * 32 * 3  # 32x32 흑백 썸네일 L1 차이 (픽셀당 평균 3단계)
+        self.max_skip_frames = 6  # 움직임이 없어도 이 프레임 수마다 한 번은 추론
+        self._prev_thumb: Optional[np.ndarray] = None
+        self._frames_since_infer = 0
+        self._last_results = None
+        self._last_focused = False
         self.session_started = False
+        self._last_send_time = 0.0  # 마지막 상태 메시지 전송 시각 (하트비트 판단용)
     
     async def connect(self) -> bool:
         """서버에 WebSocket 연결"""
         try:
-            self.websocket = await websockets.connect(self.server_url)
+            # 수십 바이트 제어 메시지라 압축은 CPU 낭비이므로 비활성화, 수신 크기/큐도 제한
+            self.websocket = await websockets.connect(
+                self.server_url,
+                compression=None,
+                max_size=2 ** 16,
+                max_queue=16
+            )
             print(f"서버에 연결되었습니다: {self.server_url}")
             return True
         except Exception as e:
@@ -151,7 +223,7 @@ class CameraClient:
         }
         
         try:
-            await self.websocket.send(json.dumps(message))
+            await self.websocket.send(orjson.dumps(message))
             self.session_started = True
             print(f"학습 세션이 시작되었습니다. (사용자: {self.user_id})")
         except Exception as e:
@@ -169,8 +241,10 @@ class CameraClient:
             "timestamp": time.time()
         }
         
+        # 전송 실패 시에도 갱신하여 매 프레임 재시도하지 않도록 함
+        self._last_send_time = message["timestamp"]
         try:
-            await self.websocket.send(json.dumps(message))
+            await self.websocket.send(orjson.dumps(message))
         except Exception as e:
             print(f"상태 업데이트 전송 실패: {e}")
     
@@ -185,7 +259,7 @@ class CameraClient:
         }
         
         try:
-            await self.websocket.send(json.dumps(message))
+            await self.websocket.send(orjson.dumps(message))
             
             # [수정됨] 서버가 처리를 완료하고 응답할 때까지 대기 (최대 2초)
             try:
@@ -202,15 +276,100 @@ class CameraClient:
         except Exception as e:
             print(f"세션 종료 실패: {e}")
     
+    def _should_infer(self, frame) -> bool:
+        """직전 추론 프레임 대비 움직임이 있거나 max_skip_frames가 지났으면 True"""
+        thumb = cv2.cvtColor(cv2.resize(frame, (32, 32), interpolation=cv2.INTER_AREA),
+                             cv2.COLOR_BGR2GRAY)
+        if (self._prev_thumb is None
+                or self._frames_since_infer >= self.max_skip_frames
+                or cv2.norm(thumb, self._prev_thumb, cv2.NORM_L1) > self.motion_threshold):
+            self._prev_thumb = thumb
+            self._frames_since_infer = 0
+            return True
+        
+        self._frames_since_infer += 1
+        return False
+    
+    async def _capture_frames(self, cap, raw_q: asyncio.Queue):
+        """1단계: 웹캠 프레임 캡처 (스트림이 끝나면 None 전달)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            ret, frame = await loop.run_in_executor(self._capture_executor, cap.read)
+            if not ret:
+                await raw_q.put(None)
+                return
+            await raw_q.put(cv2.flip(frame, 1))
+    
+    async def _infer_frames(self, raw_q: asyncio.Queue, result_q: asyncio.Queue):
+        """2단계: FaceMesh 추론 및 집중 판단 (frame, results, is_focused) 전달"""
+        loop = asyncio.get_running_loop()
+        while True:
+            frame = await raw_q.get()
+            if frame is None:
+                await result_q.put(None)
+                return
+            
+            # 카메라가 해상도 설정을 무시한 경우에만 추론용 프레임 축소
+            # (랜드마크는 정규화 좌표이므로 원본 frame에 그대로 그릴 수 있음)
+            height, width = frame.shape[:2]
+            if width > self.inference_width:
+                inference_size = (self.inference_width, height * self.inference_width // width)
+                small_frame = cv2.resize(frame, inference_size, interpolation=cv2.INTER_AREA)
+            else:
+                small_frame = frame
+            
+            if self._should_infer(small_frame):
+                # RGB 버퍼를 한 번만 할당하고 매 프레임 그 위에 변환
+                # (추론이 끝난 뒤에만 다음 프레임을 변환하므로 버퍼 하나로 충분)
+                if self._rgb is None or self._rgb.shape != small_frame.shape:
+                    self._rgb = np.empty_like(small_frame)
+                cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB, dst=self._rgb)
+                
+                # 읽기 전용으로 표시하면 MediaPipe가 내부 복사를 생략함
+                # (종료 시 이 await가 취소되어도 버퍼가 읽기 전용으로 남지 않도록 finally에서 복구)
+                self._rgb.flags.writeable = False
+                try:
+                    results = await loop.run_in_executor(
+                        self._inference_executor, self.detector.face_mesh.process, self._rgb
+                    )
+                finally:
+                    self._rgb.flags.writeable = True
+                
+                is_focused = False
+                if results.multi_face_landmarks:
+                    is_focused = self.detector.is_focused(results.multi_face_landmarks[0].landmark)
+                
+                self._last_results = results
+                self._last_focused = is_focused
+            else:
+                # 움직임이 거의 없으면 직전 추론 결과 재사용
+                results = self._last_results
+                is_focused = self._last_focused
+            
+            await result_q.put((frame, results, is_focused))
+    
     async def run(self):
-        """웹캠 실행 및 집중도 감지"""
+        """웹캠 실행 및 집중도 감지
+        
+        캡처 → 추론 → 표시/전송을 크기가 작은 큐로 연결된 세 단계로 나누어
+        프레임 처리 시간이 단계별 시간의 합이 아니라 가장 느린 단계의 시간이 되도록 합니다.
+        """
         cap = cv2.VideoCapture(0)
         
         if not cap.isOpened():
             print("웹캠을 열 수 없습니다.")
             return
         
-        print("웹캠이 시작되었습니다. 'q'를 눌러 종료하세요.")
+        # 눈 랜드마크 정확도에는 640x480이면 충분하므로 캡처 단계에서 해상도 제한
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.capture_size[0])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.capture_size[1])
+        # 드라이버 버퍼에 프레임이 쌓이지 않도록 최신 프레임 1장만 유지 (지원하는 백엔드에서만 적용)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        
+        if self.headless:
+            print("웹캠이 시작되었습니다. Ctrl+C를 눌러 종료하세요.")
+        else:
+            print("웹캠이 시작되었습니다. 'q'를 눌러 종료하세요.")
         
         if not await self.connect():
             cap.release()
@@ -218,6 +377,45 @@ class CameraClient:
         
         await self.start_session()
         
+        # 추론은 네이티브 코드에서 GIL을 놓으므로 이벤트 루프가 막히지 않고,
+        # cap.read()는 다음 프레임이 나올 때까지 블로킹하므로 각각 전용 스레드에서 실행
+        self._inference_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._capture_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        
+        # 이전 실행의 추론 스레드가 아직 쓰고 있을 수 있는 버퍼와 움직임 게이트 상태는 새로 시작
+        self._rgb = None
+        self._prev_thumb = None
+        self._frames_since_infer = 0
+        self._last_results = None
+        self._last_focused = False
+        
+        raw_q: asyncio.Queue = asyncio.Queue(maxsize=self.pipeline_queue_size)
+        result_q: asyncio.Queue = asyncio.Queue(maxsize=self.pipeline_queue_size)
+        stages = [
+            asyncio.create_task(self._capture_frames(cap, raw_q)),
+            asyncio.create_task(self._infer_frames(raw_q, result_q)),
+        ]
+        
+        def stop_on_error(task: asyncio.Task):
+            # 앞 단계가 예외로 끝나면 표시 단계가 무한 대기하지 않도록 종료 신호 전달
+            if not task.cancelled() and task.exception() is not None:
+                print(f"파이프라인 오류: {task.exception()}")
+                asyncio.ensure_future(result_q.put(None))
+        
+        for stage in stages:
+            stage.add_done_callback(stop_on_error)
+        
+        # 헤드리스 모드에서는 waitKey 대신 SIGINT로 종료 요청을 받음
+        loop = asyncio.get_running_loop()
+        stop_event = asyncio.Event()
+        sigint_handled = False
+        if self.headless:
+            try:
+                loop.add_signal_handler(signal.SIGINT, stop_event.set)
+                sigint_handled = True
+            except NotImplementedError:
+                pass  # Windows: KeyboardInterrupt로 종료
+        
         # 상태 추적
         current_state = None
         confirmed_state = None
@@ -226,43 +424,42 @@ class CameraClient:
         state_change_time = None
         debounce_time = 0.5
         
-        last_heartbeat_time = time.time()
-        heartbeat_interval = 5.0
+        # 상태 변화가 없을 때만 보내는 저빈도 하트비트
+        heartbeat_interval = 10.0
         
         try:
             while True:
-                ret, frame = cap.read()
-                if not ret:
+                # 3단계: 화면 표시, 상태 판단, 서버 전송
+                item = await result_q.get()
+                if item is None:
                     break
+                frame, results, is_focused = item
                 
-                frame = cv2.flip(frame, 1)
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                results = self.detector.face_mesh.process(rgb_frame)
-                
-                is_focused = False
+                if stop_event.is_set():
+                    break
                 
-                if results.multi_face_landmarks:
-                    face_landmarks = results.multi_face_landmarks[0]
-                    is_focused = self.detector.is_focused(face_landmarks.landmark)
+                # 화면에 표시하지 않으면 그리기 작업은 모두 생략
+                if not self.headless:
+                    if results.multi_face_landmarks:
+                        face_landmarks = results.multi_face_landmarks[0]
+                        
+                        mp_drawing.draw_landmarks(
+                            frame,
+                            face_landmarks,
+                            mp_face_mesh.FACEMESH_CONTOURS,
+                            None,
+                            mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=1, circle_radius=1)
+                        )
+                    elif self.debug:
+                        cv2.putText(frame, "No Face Detected", (10, 110),
+                                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
                     
-                    mp_drawing.draw_landmarks(
-                        frame,
-                        face_landmarks,
-                        mp_face_mesh.FACEMESH_CONTOURS,
-                        None,
-                        mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=1, circle_radius=1)
-                    )
-                else:
-                    cv2.putText(frame, "No Face Detected", (10, 110),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                
-                status_text = "Focused" if is_focused else "Unfocused"
-                status_color = (0, 255, 0) if is_focused else (0, 0, 255)
-                cv2.putText(frame, f"Status: {status_text}", (10, 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, status_color, 2)
-                cv2.putText(frame, f"User: {self.user_id}", (10, 70),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+                    status_text = "Focused" if is_focused else "Unfocused"
+                    status_color = (0, 255, 0) if is_focused else (0, 0, 255)
+                    cv2.putText(frame, f"Status: {status_text}", (10, 30),
+                               cv2.FONT_HERSHEY_SIMPLEX, 1, status_color, 2)
+                    cv2.putText(frame, f"User: {self.user_id}", (10, 70),
+                               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
                 
                 current_time = time.time()
                 
@@ -285,8 +482,10 @@ class CameraClient:
                         # 이전 상태의 지속 시간 계산
                         duration = state_change_time - confirmed_state_start
                         
-                        print(f"[상태 변화 확정] {'Focused' if confirmed_state else 'Unfocused'} "
-                              f"→ {'Focused' if current_state else 'Unfocused'} (지속시간: {duration:.2f}초)")
+                        if self.debug:
+                            logger.debug("[상태 변화 확정] %s → %s (지속시간: %.2f초)",
+                                         'Focused' if confirmed_state else 'Unfocused',
+                                         'Focused' if current_state else 'Unfocused', duration)
                         
                         # 새 상태와 이전 상태의 지속 시간 전송
                         await self.send_status_update(current_state, duration=duration)
@@ -294,28 +493,41 @@ class CameraClient:
                         confirmed_state = current_state
                         confirmed_state_start = state_change_time
                 
-                # 하트비트
-                if current_time - last_heartbeat_time >= heartbeat_interval:
+                # 하트비트 (마지막 전송 이후 heartbeat_interval 동안 보낸 메시지가 없을 때만)
+                if current_time - self._last_send_time >= heartbeat_interval:
                     await self.send_status_update(confirmed_state, duration=0.0)
-                    last_heartbeat_time = current_time
-                    print(f"[하트비트] {'Focused' if confirmed_state else 'Unfocused'}")
+                    if self.debug:
+                        logger.debug("[하트비트] %s", 'Focused' if confirmed_state else 'Unfocused')
                 
-                cv2.imshow('Focus Detection', frame)
-                
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
+                if not self.headless:
+                    cv2.imshow('Focus Detection', frame)
+                    
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
                     
         except KeyboardInterrupt:
             print("\n프로그램이 중단되었습니다.")
         finally:
+            if sigint_handled:
+                loop.remove_signal_handler(signal.SIGINT)
+            
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            
             # 마지막 상태의 지속 시간 전송
             if confirmed_state_start:
                 final_duration = time.time() - confirmed_state_start
                 await self.send_status_update(confirmed_state, duration=final_duration)
             
             await self.end_session()
+            # 진행 중인 cap.read()가 끝난 뒤 카메라 해제
+            self._capture_executor.shutdown(wait=True)
             cap.release()
-            cv2.destroyAllWindows()
+            if not self.headless:
+                cv2.destroyAllWindows()
+            # 공유 FaceMesh는 다른 클라이언트/재실행에서도 쓰므로 프로세스 종료 시(atexit)에만 해제
+            self._inference_executor.shutdown(wait=False)
             if self.websocket:
                 await self.websocket.close()
             print("리소스가 정리되었습니다.")
@@ -330,12 +542,27 @@ async def main():
                        help='서버 WebSocket URL (기본값: ws://localhost:8000/ws)')
     parser.add_argument('--user', type=str, default='user1',
                        help='사용자 ID (기본값: user1)')
+    parser.add_argument('--debug', action='store_true',
+                       help='EAR/상태 변화/하트비트 디버그 로그 출력')
+    parser.add_argument('--headless', action='store_true',
+                       help='미리보기 창 없이 실행 (Ctrl+C로 종료)')
     
     args = parser.parse_args()
     
-    client = CameraClient(server_url=args.server, user_id=args.user)
+    if args.debug:
+        # 이 모듈 로거에만 DEBUG 적용 (websockets/asyncio 등 라이브러리 디버그 로그는 제외)
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+    
+    client = CameraClient(server_url=args.server, user_id=args.user, debug=args.debug,
+                          headless=args.headless)
     await client.run()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file